@@ -6,8 +6,11 @@ from .data_processor import convert_data_types, feature_scaling, data_aggregatio
 from .report_generator import generate_visualization_report, generate_data_quality_comparison_report
 import os
 from .template_generator import create_report_template
+from .checkpoint import CheckpointStore, input_fingerprint
+from .sampling import load_sample, approximate_quality_metrics
 import json
 import argparse
+import time
 from .generate_config import ConfigGenerator  # 导入封装好的类
 
 # 配置日志记录
@@ -16,60 +19,189 @@ logging.basicConfig(level=logging.INFO,
 
 class DataProcessingPipeline:
     """数据清洗处理管道"""
-    
-    def __init__(self, config_path):
+
+    # 加载后的处理阶段：(阶段名, 处理函数, 对应的配置节)
+    CLEANING_STAGES = [
+        ('handle_duplicates', handle_duplicates, 'duplicates'),
+        ('handle_outliers', handle_outliers, 'outliers'),
+        ('clean_text', clean_text, 'text_cleaning'),
+        ('handle_missing_values', handle_missing_values, 'missing_value'),
+        ('feature_scaling', feature_scaling, 'feature_scaling'),
+        ('data_aggregation', data_aggregation, 'aggregation'),
+    ]
+    # 影响数据加载结果的配置项
+    LOAD_CONFIG_KEYS = ('input_path', 'sample')
+
+    def __init__(self, config_path, sample=None):
         """
         初始化处理管道
-        :param config_path: 配置文件路径
+        :param config_path: 配置文件路径，也可以直接传入已解析的配置字典
+        :param sample: 近似模式的样本行数，设置后只在抽样数据上运行，覆盖配置中的 sample.size
         """
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                self.config = json.load(f)
-        except FileNotFoundError:
-            logging.error(f"配置文件 {config_path} 未找到")
-            raise
-        except Exception as e:
-            logging.error(f"读取配置文件 {config_path} 失败: {str(e)}")
-            raise
         self.df = None
         self.scalers = {}
+        self.key_index = None  # 按键去重得到的分组索引，供聚合阶段复用
+        self.sketch_metrics = None  # 近似模式下全量数据的草图统计
+        self.load_failures = []  # 多文件输入时读取失败的文件及原因
+        self.stage_timings = {}  # 各阶段耗时（秒）
+        if isinstance(config_path, dict):
+            self.config = dict(config_path)
+        else:
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    self.config = json.load(f)
+            except FileNotFoundError:
+                logging.error(f"配置文件 {config_path} 未找到")
+                raise
+            except Exception as e:
+                logging.error(f"读取配置文件 {config_path} 失败: {str(e)}")
+                raise
+        if sample is not None:
+            self.config['sample'] = dict(self.config.get('sample', {}), size=sample)
+        if 'sample' in self.config:
+            # 近似模式的结果写入单独的子目录，避免覆盖全量运行的结果
+            self.config['output_path'] = os.path.join(self.config['output_path'], 'sample')
+
+    def _load(self):
+        """加载数据，近似模式下流式抽样并在全量数据上计算草图统计"""
+        self.load_failures = []
+        if 'sample' in self.config:
+            df, self.sketch_metrics = load_sample(self.config, self.load_failures)
+            return df
+        return load_data(self.config, self.load_failures)
+
+    def _load_state(self):
+        """加载阶段除数据以外需要随检查点保存的状态"""
+        return {'sketch_metrics': self.sketch_metrics, 'load_failures': self.load_failures}
+
+    def _restore_load_state(self, state):
+        self.sketch_metrics = state['sketch_metrics']
+        self.load_failures = state['load_failures']
+
+    def _run_stage(self, name, func, *args):
+        """执行单个处理阶段并记录耗时，阶段失败时同样记录其已运行的时间"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.stage_timings[name] = time.perf_counter() - start
+
+    def _apply_stage(self, name, func):
+        """执行一个处理阶段并更新管道状态"""
+        if name == 'handle_duplicates':
+            self.df, self.key_index = self._run_stage(name, func, self.df, self.config, True)
+        elif name == 'feature_scaling':
+            self.df, self.scalers = self._run_stage(name, func, self.df, self.config)
+        elif name == 'data_aggregation':
+            self.df = self._run_stage(name, func, self.df, self.config, self.key_index)
+        else:
+            self.df = self._run_stage(name, func, self.df, self.config)
+
+    def save_output(self):
+        """按配置的输出格式保存处理结果"""
+        output_dir = self.config['output_path']
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        output_format = self.config.get('output_format', 'csv')
+        if output_format == 'csv':
+            output_file_path = os.path.join(output_dir, f"cleaned.csv")
+            self.df.to_csv(output_file_path, index=False)
+        elif output_format == 'parquet':
+            output_file_path = os.path.join(output_dir, f"cleaned.parquet")
+            self.df.to_parquet(output_file_path)
+        elif output_format == 'json':
+            output_file_path = os.path.join(output_dir, f"cleaned.json")
+            self.df.to_json(output_file_path)
+        elif output_format == 'jsonl':
+            output_file_path = os.path.join(output_dir, f"cleaned.jsonl")
+            self.df.to_json(output_file_path, orient='records', lines=True)
+        else:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+
+        logging.info(f"处理结果已保存至 {output_file_path}")
+        return output_file_path
+
+    def _checkpoint_keys(self):
+        """
+        计算加载阶段及每个处理阶段的检查点键，依次链式依赖
+        未配置的阶段不会改变数据，其键为 None，既不写入检查点也不参与链式计算
+        """
+        load_config = {key: self.config.get(key) for key in self.LOAD_CONFIG_KEYS}
+        keys = [CheckpointStore.stage_key(input_fingerprint(self.config['input_path']), 'load_data', load_config)]
+        parent_key = keys[0]
+        for name, _, section in self.CLEANING_STAGES:
+            if section not in self.config:
+                keys.append(None)
+                continue
+            parent_key = CheckpointStore.stage_key(parent_key, name, self.config[section])
+            keys.append(parent_key)
+        return keys
+
+    def _resume(self, checkpoints, keys):
+        """
+        从最后一个有效检查点恢复
+        :return: (原始数据副本, 已完成的处理阶段数)，没有可用检查点时返回 (None, 0)
+        """
+        for index in range(len(keys) - 1, -1, -1):
+            if keys[index] is None:
+                continue
+            restored = checkpoints.load(keys[index])
+            if restored is None:
+                continue
+            self.df, state = restored
+            if index > 0:
+                self.scalers = state['scalers']
+                self.key_index = state.get('key_index')
+            stage = 'load_data' if index == 0 else self.CLEANING_STAGES[index - 1][0]
+            logging.info(f"从阶段 {stage} 的检查点恢复")
+            if index == 0:
+                self._restore_load_state(state)
+                return self.df.copy(), 0
+            original = checkpoints.load(keys[0])
+            if original is None:
+                original_df = self._run_stage('load_data', self._load)
+                checkpoints.save(keys[0], original_df, self._load_state())
+            else:
+                original_df, load_state = original
+                self._restore_load_state(load_state)
+            return original_df, index
+        return None, 0
 
     def run(self):
-        """执行完整处理流程"""
+        """执行完整处理流程，配置了 checkpoint 时每个阶段完成后写入检查点并支持断点续跑"""
+        self.stage_timings = {}
+        checkpoints = CheckpointStore.from_config(self.config)
         try:
-            self.df = load_data(self.config)
-            original_df = self.df.copy()  # 保存原始数据副本
-            self.df = handle_duplicates(self.df, self.config)
-            self.df = handle_outliers(self.df, self.config)
-            self.df = clean_text(self.df, self.config)
-            self.df = handle_missing_values(self.df, self.config)
-            self.df, self.scalers = feature_scaling(self.df, self.config)
-            self.df = data_aggregation(self.df, self.config)
+            original_df, start = None, 0
+            if checkpoints is not None:
+                keys = self._checkpoint_keys()
+                original_df, start = self._resume(checkpoints, keys)
+            if original_df is None:
+                self.df = self._run_stage('load_data', self._load)
+                original_df = self.df.copy()  # 保存原始数据副本
+                if checkpoints is not None:
+                    checkpoints.save(keys[0], self.df, self._load_state())
+
+            for index in range(start, len(self.CLEANING_STAGES)):
+                name, func, _ = self.CLEANING_STAGES[index]
+                self._apply_stage(name, func)
+                if checkpoints is not None and keys[index + 1] is not None:
+                    checkpoints.save(keys[index + 1], self.df,
+                                     {'scalers': self.scalers, 'key_index': self.key_index})
             # 保存数据
-            output_dir = self.config['output_path']
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            output_format = self.config.get('output_format', 'csv')
-            if output_format == 'csv':
-                output_file_path = os.path.join(output_dir, f"cleaned.csv")
-                self.df.to_csv(output_file_path, index=False)
-            elif output_format == 'parquet':
-                output_file_path = os.path.join(output_dir, f"cleaned.parquet")
-                self.df.to_parquet(output_file_path)
-            elif output_format == 'json':
-                output_file_path = os.path.join(output_dir, f"cleaned.json")
-                self.df.to_json(output_file_path)
-            elif output_format == 'jsonl':
-                output_file_path = os.path.join(output_dir, f"cleaned.jsonl")
-                self.df.to_json(output_file_path, orient='records', lines=True)
-            else:
-                raise ValueError(f"不支持的输出格式: {output_format}")
-            
-            logging.info(f"处理结果已保存至 {output_file_path}")
+            output_file_path = self._run_stage('save_output', self.save_output)
 
-            generate_visualization_report(self.df, original_df, self.config)
-            generate_data_quality_comparison_report(self.df, original_df, self.config)
+            approx_metrics = None
+            if self.sketch_metrics is not None:
+                approx_metrics = approximate_quality_metrics(self.df, original_df, self.sketch_metrics,
+                                                             'aggregation' in self.config,
+                                                             self.config.get('duplicates'))
+            self._run_stage('visualization_report', generate_visualization_report,
+                            self.df, original_df, self.config, approx_metrics)
+            self._run_stage('quality_report', generate_data_quality_comparison_report,
+                            self.df, original_df, self.config, approx_metrics)
+            return output_file_path
         except Exception as e:
             logging.error(f"数据处理流程异常终止：{str(e)}")
             raise
@@ -79,8 +211,16 @@ def main():
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--dataset', help='输入数据集文件路径')
     group.add_argument('--config', help='指定 JSON 配置文件路径')
+    group.add_argument('--serve', action='store_true', help='以常驻服务模式运行，通过 HTTP 接收清洗作业')
     parser.add_argument('--api_url', default='http://192.168.200.54:11434/api/generate', help='大模型的 API URL')
     parser.add_argument('--model_name', default='deepseek-coder:33b', help='大模型的名字')
+    parser.add_argument('--host', default='127.0.0.1', help='服务模式监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='服务模式监听端口')
+    parser.add_argument('--workers', type=int, default=2, help='服务模式的预热工作进程数量')
+    parser.add_argument('--max_concurrent', type=int, help='服务模式同时运行的作业上限，默认等于工作进程数量，不能超过工作进程数量')
+    parser.add_argument('--memory_limit_mb', type=int, help='服务模式下每个作业的默认内存预算（MB）')
+    parser.add_argument('--sample', type=int, nargs='?', const=10000,
+                        help='近似模式：只在抽样的若干行（默认 10000）上运行，用于快速迭代配置')
 
     args = parser.parse_args()
 
@@ -94,7 +234,7 @@ def main():
         # 开始数据清洗
         create_report_template()
         try:
-            pipeline = DataProcessingPipeline(output_file_path)
+            pipeline = DataProcessingPipeline(output_file_path, sample=args.sample)
             pipeline.run()
         except Exception as e:
             logging.error(f"主程序异常：{str(e)}")
@@ -107,7 +247,7 @@ def main():
         create_report_template()
 
         try:
-            pipeline = DataProcessingPipeline(args.config)
+            pipeline = DataProcessingPipeline(args.config, sample=args.sample)
             pipeline.run()
         except Exception as e:
             logging.error(f"主程序异常：{str(e)}")
@@ -115,6 +255,10 @@ def main():
             # 确保在生成报告之后再删除模板文件
             if os.path.exists("report_template.html"):
                 os.remove("report_template.html")
+    elif args.serve:
+        from .service import serve
+        serve(host=args.host, port=args.port, workers=args.workers,
+              max_concurrent=args.max_concurrent, memory_limit_mb=args.memory_limit_mb)
     else:
         parser.print_help()
 
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import pickle
+import tempfile
+import hashlib
+import logging
+import pyarrow as pa
+import pyarrow.feather as feather
+from .data_loader import resolve_input_files
+
+
+def _hash(*parts):
+    """对若干可 JSON 序列化的对象计算稳定哈希"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def input_fingerprint(input_path):
+    """
+    根据路径、大小和修改时间生成输入文件指纹，文件变化后旧检查点自动失效
+    input_path 为通配符或目录时，对匹配到的全部文件计算指纹，新增或删除文件同样会使检查点失效
+    """
+    files, _ = resolve_input_files(input_path)
+    fingerprint = []
+    for path in files:
+        stat = os.stat(path)
+        fingerprint.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return _hash(fingerprint)
+
+
+class CheckpointStore:
+    """
+    阶段检查点存储
+    每个阶段的中间结果以 Feather 格式写入本地目录，键由上一阶段的键与本阶段的配置共同决定，
+    因此只修改后续阶段的配置时，前面阶段的检查点仍然有效。
+    多个作业可以共享同一目录：临时文件名各不相同，被其他作业抢先删除的文件视为已处理，
+    检查点读写失败只记录警告，不会中断清洗流程。
+    """
+
+    def __init__(self, checkpoint_dir='.checkpoints', max_age_hours=72, max_size_mb=2048):
+        """
+        :param checkpoint_dir: 检查点目录
+        :param max_age_hours: 检查点最长保留时间（小时），为空时不按时间淘汰
+        :param max_size_mb: 检查点目录总大小上限（MB），为空时不按大小淘汰
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.max_age_hours = max_age_hours
+        self.max_size_mb = max_size_mb
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.evict()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 checkpoint 节创建存储，未配置时返回 None"""
+        if 'checkpoint' not in config:
+            return None
+        checkpoint_config = config['checkpoint']
+        try:
+            return cls(checkpoint_config.get('dir', '.checkpoints'),
+                       checkpoint_config.get('max_age_hours', 72),
+                       checkpoint_config.get('max_size_mb', 2048))
+        except OSError as e:
+            logging.warning(f"检查点目录不可用，本次运行不使用检查点：{str(e)}")
+            return None
+
+    @staticmethod
+    def stage_key(parent_key, stage, stage_config):
+        """计算阶段检查点的键"""
+        return _hash(parent_key, stage, stage_config)
+
+    def _paths(self, key):
+        base = os.path.join(self.checkpoint_dir, key)
+        return base + '.feather', base + '.meta.pkl'
+
+    def exists(self, key):
+        return all(os.path.exists(path) for path in self._paths(key))
+
+    def save(self, key, df, extra=None):
+        """
+        保存阶段结果
+        :param key: 检查点键
+        :param df: 阶段输出的 DataFrame
+        :param extra: 需要随检查点保存的其他对象（如缩放器）
+        :return: 是否保存成功
+        """
+        data_path, meta_path = self._paths(key)
+        # Feather 要求列名为字符串，这里按位置命名，原始列名（包括 MultiIndex）保存在元数据中
+        stored = df.copy(deep=False)
+        stored.columns = [str(i) for i in range(df.shape[1])]
+        meta = {'columns': df.columns, 'extra': extra, 'object_columns': {}}
+        temp_paths = []
+        try:
+            # 临时文件名唯一，多个作业同时写入同一检查点时互不干扰，最后一次替换生效
+            data_tmp, meta_tmp = self._temp_path(key, temp_paths), self._temp_path(key, temp_paths)
+            try:
+                feather.write_feather(stored, data_tmp, compression='uncompressed')
+            except pa.ArrowException:
+                # 混合类型的 object 列（如数值列填充了字符串）无法转换为 Arrow，改为随元数据保存
+                for name in stored.columns[(stored.dtypes == object).to_numpy()]:
+                    try:
+                        pa.array(stored[name], from_pandas=True)
+                    except pa.ArrowException:
+                        meta['object_columns'][name] = stored[name]
+                stored = stored.drop(columns=list(meta['object_columns']))
+                feather.write_feather(stored, data_tmp, compression='uncompressed')
+            with open(meta_tmp, 'wb') as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # 先写元数据再替换数据文件，数据文件存在即代表检查点完整
+            os.replace(meta_tmp, meta_path)
+            os.replace(data_tmp, data_path)
+        except Exception as e:
+            logging.warning(f"检查点 {key} 保存失败，跳过：{str(e)}")
+            for path in temp_paths:
+                self._remove_file(path)
+            return False
+        self.evict()
+        return True
+
+    def _temp_path(self, key, temp_paths):
+        """在检查点目录中创建唯一的临时文件，并记录以便失败时清理"""
+        fd, path = tempfile.mkstemp(prefix=key + '.', suffix='.tmp', dir=self.checkpoint_dir)
+        os.close(fd)
+        temp_paths.append(path)
+        return path
+
+    def load(self, key):
+        """读取阶段结果，返回 (df, extra)；检查点不存在或已损坏时返回 None"""
+        if not self.exists(key):
+            return None
+        data_path, meta_path = self._paths(key)
+        try:
+            df = feather.read_feather(data_path, memory_map=True)
+            with open(meta_path, 'rb') as f:
+                meta = pickle.load(f)
+            for name, column in meta['object_columns'].items():
+                df[name] = column
+            df = df[[str(i) for i in range(len(meta['columns']))]]
+            df.columns = meta['columns']
+        except Exception as e:
+            logging.warning(f"检查点 {key} 读取失败，已删除：{str(e)}")
+            self._remove(key)
+            return None
+        now = time.time()
+        for path in self._paths(key):
+            try:
+                os.utime(path, (now, now))  # 记录最近使用时间，淘汰时优先保留
+            except FileNotFoundError:
+                pass  # 已被其他作业淘汰，本次读取的数据仍然有效
+        return df, meta['extra']
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # 已被其他作业删除
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            self._remove_file(path)
+
+    def evict(self):
+        """按保留时间和目录总大小淘汰检查点，优先淘汰最久未使用的；淘汰失败只记录警告"""
+        try:
+            self._evict()
+        except OSError as e:
+            logging.warning(f"检查点淘汰失败：{str(e)}")
+
+    def _evict(self):
+        entries = {}
+        now = time.time()
+        for name in os.listdir(self.checkpoint_dir):
+            path = os.path.join(self.checkpoint_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # 列出目录后被其他作业删除
+            if name.endswith('.tmp'):
+                # 可能正被其他作业写入，只清理异常退出后遗留的过期临时文件
+                if self.max_age_hours is not None and now - stat.st_mtime > self.max_age_hours * 3600:
+                    self._remove_file(path)
+                continue
+            key = name.split('.', 1)[0]
+            size, mtime = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(mtime, stat.st_mtime))
+
+        if self.max_age_hours is not None:
+            for key, (_, mtime) in list(entries.items()):
+                if now - mtime > self.max_age_hours * 3600:
+                    self._remove(key)
+                    del entries[key]
+                    logging.info(f"检查点 {key} 已过期，已删除")
+
+        if self.max_size_mb is not None:
+            total = sum(size for size, _ in entries.values())
+            for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_size_mb * 1024 * 1024:
+                    break
+                self._remove(key)
+                total -= size
+                logging.info(f"检查点目录超出 {self.max_size_mb} MB，已删除检查点 {key}")
@@ -3,13 +3,130 @@ import numpy as np
 import re
 import logging
 
-def handle_duplicates(df, config):
-    """处理重复值"""
+class KeyIndex:
+    """
+    按键排序得到的分组索引
+    记录每行所属分组编号（按键值升序编号）和每个分组的键值，
+    后续按相同键聚合时可直接复用，无需再次对键做哈希分组。
+    """
+
+    def __init__(self, columns, index, codes, keys):
+        """
+        :param columns: 键列
+        :param index: 行标签
+        :param codes: 每行的分组编号，与 index 一一对应
+        :param keys: 每个分组的键值，第 i 行对应编号 i
+        """
+        self.columns = columns
+        self.index = index
+        self.codes = codes
+        self.keys = keys
+
+    def codes_for(self, df, columns):
+        """
+        返回 df 各行的分组编号，键含空值的行编号为 -1
+        键列不同、行不在索引中或键值已被修改时无法复用，返回 None
+        """
+        if list(columns) != self.columns or not df.index.is_unique:
+            return None
+        positions = self.index.get_indexer(df.index)
+        if (positions < 0).any():
+            return None
+        codes = self.codes[positions]
+        for col in self.columns:
+            expected = pd.Series(self.keys[col].to_numpy()[codes])
+            actual = pd.Series(df[col].to_numpy())
+            same = (expected == actual).fillna(False) | (expected.isna() & actual.isna())
+            if not same.all():
+                return None
+        has_na = self.keys[self.columns].isna().any(axis=1).to_numpy()
+        return np.where(has_na[codes], -1, codes)
+
+
+def _sort_values(series, na_position='last'):
+    """把一列转换为可直接 lexsort 的数组，空值排在最后（或最前）"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) and not series.hasnans:
+        return series.to_numpy()
+    codes, uniques = pd.factorize(series, sort=True)
+    codes = codes.astype(np.int64)
+    codes[codes < 0] = len(uniques) if na_position == 'last' else -1
+    return codes
+
+
+def dedupe_sorted(df, subset, keep='first', order_by=None):
+    """
+    基于排序的去重：按键（及排序列）做一次 lexsort，相邻行键值变化处即为分组边界，
+    用一个边界掩码选出保留的行，不做 groupby。
+    :param subset: 键列
+    :param keep: 'first' 保留 order_by 最小（未指定时为最早出现）的行，'last' 保留最大的行，False 删除所有重复行
+    :param order_by: 决定组内先后的列，空值视为最旧（排在所有非空值之前）
+    :return: (去重后的 DataFrame, KeyIndex)
+
+    >>> df = pd.DataFrame({'k': [1, 1, 2, 2], 't': [5.0, np.nan, 3.0, 4.0]})
+    >>> dedupe_sorted(df, ['k'], 'first', 't')[0]['t'].tolist()
+    [nan, 3.0]
+    >>> dedupe_sorted(df, ['k'], 'last', 't')[0]['t'].tolist()
+    [5.0, 4.0]
+    """
+    n = len(df)
+    key_values = [_sort_values(df[col]) for col in subset]
+    sort_keys = list(reversed(key_values))  # lexsort 以最后一个数组为主键
+    if order_by is not None:
+        sort_keys.insert(0, _sort_values(df[order_by], 'first'))
+    order = np.lexsort(sort_keys) if n else np.empty(0, dtype=np.int64)
+
+    boundary = np.zeros(n, dtype=bool)
+    if n:
+        boundary[0] = True
+        for values in key_values:
+            sorted_values = values[order]
+            boundary[1:] |= sorted_values[1:] != sorted_values[:-1]
+    group_end = np.append(boundary[1:], True) if n else boundary
+
+    if keep == 'first':
+        mask = boundary
+    elif keep == 'last':
+        mask = group_end
+    elif keep is False:
+        mask = boundary & group_end  # 分组只有一行
+    else:
+        raise ValueError(f"不支持的 keep 取值: {keep}")
+
+    sorted_codes = np.cumsum(boundary) - 1
+    codes = np.empty(n, dtype=np.int64)
+    codes[order] = sorted_codes
+    keys = df[subset].iloc[order[boundary]].reset_index(drop=True)
+
+    kept = np.sort(order[mask])  # 恢复原始行顺序
+    result = df.iloc[kept]
+    return result, KeyIndex(list(subset), result.index, codes[kept], keys)
+
+
+def handle_duplicates(df, config, return_key_index=False):
+    """
+    处理重复值
+    配置示例：
+        "duplicates": {"remove": true}  按整行去重
+        "duplicates": {"remove": true, "subset": ["booking_id"], "keep": "last", "order_by": "updated_at"}
+    :param return_key_index: 为 True 时同时返回按键去重得到的 KeyIndex（整行去重或未去重时为 None）
+    """
+    key_index = None
     if 'duplicates' in config and config['duplicates']['remove']:
+        dup_config = config['duplicates']
+        subset = dup_config.get('subset')
+        if isinstance(subset, str):
+            subset = [subset]
+        keep = dup_config.get('keep', 'first')
+        order_by = dup_config.get('order_by')
         original_rows = df.shape[0]
-        df = df.drop_duplicates()
+        if subset is None and order_by is None:
+            df = df.drop_duplicates(keep=keep)
+        else:
+            df, key_index = dedupe_sorted(df, subset or list(df.columns), keep, order_by)
         removed_rows = original_rows - df.shape[0]
         logging.info(f"已删除 {removed_rows} 条重复记录")
+    if return_key_index:
+        return df, key_index
     return df
 
 def handle_outliers(df, config):
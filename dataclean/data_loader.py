@@ -1,26 +1,170 @@
 import pandas as pd
 import logging
+import os
+import glob
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
 
-def load_data(config):
-    """加载数据，支持 CSV、Parquet、JSON 和 JSONL 格式"""
+# pandas 可根据扩展名自动解压的压缩格式
+COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst', '.zip')
+SUPPORTED_FORMATS = ('csv', 'parquet', 'json', 'jsonl')
+# Hive 分区中表示空值的目录名
+HIVE_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def get_file_format(path):
+    """根据扩展名（忽略压缩后缀）判断文件格式，不支持时返回 None"""
+    name = path.lower()
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    file_format = os.path.splitext(name)[1].lstrip('.')
+    return file_format if file_format in SUPPORTED_FORMATS else None
+
+
+def _is_hidden(name):
+    # 跳过 _SUCCESS、_metadata、.crc 等由写入框架生成的辅助文件
+    return name.startswith('_') or name.startswith('.')
+
+
+def resolve_input_files(input_path):
+    """
+    将 input_path 解析为文件列表，支持单个文件、glob 通配符和目录（递归查找）
+    :return: (文件列表, 用于解析分区目录的根目录)；单个文件时根目录为 None
+    """
+    if glob.has_magic(input_path):
+        files = sorted(path for path in glob.glob(input_path, recursive=True)
+                       if os.path.isfile(path) and get_file_format(path))
+        # 通配符之前的部分作为分区根目录
+        parts = input_path.replace('\\', '/').split('/')
+        static = []
+        for part in parts:
+            if glob.has_magic(part):
+                break
+            static.append(part)
+        root = '/'.join(static) or '.'
+    elif os.path.isdir(input_path):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(input_path):
+            dirnames[:] = sorted(d for d in dirnames if not _is_hidden(d))
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                         if not _is_hidden(name) and get_file_format(name))
+        root = input_path
+    else:
+        return [input_path], None
+    if not files:
+        raise FileNotFoundError(f"{input_path} 中没有找到支持格式的输入文件")
+    return files, root
+
+
+def parse_partitions(path, root):
+    """从 Hive 风格的目录（如 dt=2024-01-01/region=eu）中解析分区列"""
+    if root is None:
+        return {}
+    partitions = {}
+    relative = os.path.relpath(os.path.dirname(path), root)
+    for part in relative.replace('\\', '/').split('/'):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            partitions[unquote(key)] = None if value == HIVE_NULL_PARTITION else unquote(value)
+    return partitions
+
+
+def read_file(path):
+    """按格式读取单个文件，压缩格式由 pandas 根据扩展名自动解压"""
+    file_format = get_file_format(path)
+    if file_format == 'csv':
+        # 使用 utf-8 编码，并指定编码错误处理方式为替换
+        return pd.read_csv(path, encoding='utf-8', encoding_errors='replace')
+    elif file_format == 'parquet':
+        return pd.read_parquet(path)
+    elif file_format == 'json':
+        return pd.read_json(path)
+    elif file_format == 'jsonl':
+        return pd.read_json(path, lines=True)
+    raise ValueError(f"不支持的文件格式: {path}")
+
+
+def add_partition_columns(df, partitions):
+    """
+    把分区值作为常量列添加到数据中，文件内已有同名列时以文件内容为准
+    :return: 实际添加的分区列名
+    """
+    added = []
+    for key, value in partitions.items():
+        if key not in df.columns:
+            df[key] = value
+            added.append(key)
+    return added
+
+
+def _read_partition_file(path, root):
+    df = read_file(path)
+    return df, add_partition_columns(df, parse_partitions(path, root))
+
+
+def _union(frames, partition_columns):
+    """合并多个文件的数据，缺失列补空值，并报告各文件之间不一致的列类型"""
+    dtypes = {}
+    for frame in frames:
+        for col, dtype in frame.dtypes.items():
+            dtypes.setdefault(col, set()).add(str(dtype))
+    for col, kinds in dtypes.items():
+        if len(kinds) > 1 and col not in partition_columns:
+            logging.warning(f"列 {col} 在不同文件中类型不一致：{sorted(kinds)}，合并时自动统一")
+    missing = [col for col in dtypes if any(col not in frame.columns for frame in frames)]
+    if missing:
+        logging.warning(f"部分文件缺少列 {missing}，已填充为空值")
+
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    for col in partition_columns:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def load_data(config, failures=None):
+    """
+    加载数据，支持 CSV、Parquet、JSON 和 JSONL 格式
+    input_path 可以是单个文件、glob 通配符（如 data/part-*.csv.gz）或目录（支持 Hive 风格分区），
+    多个文件时使用线程池并行读取和解压，合并后分区列转换为 category 类型。
+    :param failures: 可选列表，用于收集读取失败的文件及原因；单个文件失败不会中断整个加载
+    """
     input_path = config['input_path']
     try:
-        if input_path.lower().endswith('.csv'):
-            # 使用 utf-8 编码，并指定编码错误处理方式为替换
-            df = pd.read_csv(input_path, encoding='utf-8', encoding_errors='replace')
-        elif input_path.lower().endswith('.parquet'):
-            df = pd.read_parquet(input_path)
-        elif input_path.lower().endswith('.json'):
-            df = pd.read_json(input_path)
-        elif input_path.lower().endswith('.jsonl'):
-            df = pd.read_json(input_path, lines=True)
-        else:
-            raise ValueError(f"不支持的文件格式: {input_path}")
-        logging.info(f"成功加载数据，形状：{df.shape}")
+        files, root = resolve_input_files(input_path)
+        if root is None:
+            if get_file_format(input_path) is None:
+                raise ValueError(f"不支持的文件格式: {input_path}")
+            df = read_file(input_path)
+            logging.info(f"成功加载数据，形状：{df.shape}")
+            return df
+
+        max_workers = config.get('load_workers', min(32, (os.cpu_count() or 1) + 4))
+        frames, errors, partition_columns = [], [], set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_read_partition_file, path, root) for path in files]
+            for path, future in zip(files, futures):
+                try:
+                    frame, added = future.result()
+                except Exception as e:
+                    logging.warning(f"文件 {path} 读取失败：{str(e)}")
+                    errors.append((path, str(e)))
+                    continue
+                frames.append(frame)
+                partition_columns.update(added)
+        if failures is not None:
+            failures.extend(errors)
+        if not frames:
+            raise ValueError(f"{input_path} 下的 {len(files)} 个文件全部读取失败")
+        df = _union(frames, partition_columns)
+        if errors:
+            logging.warning(f"{len(errors)}/{len(files)} 个文件读取失败，已跳过")
+        logging.info(f"成功加载 {len(frames)} 个文件，合并后形状：{df.shape}")
         return df
     except FileNotFoundError:
         logging.error("输入文件不存在")
         raise
     except Exception as e:
         logging.error(f"数据加载失败：{str(e)}")
-        raise
\ No newline at end of file
+        raise
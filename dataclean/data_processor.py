@@ -55,15 +55,38 @@ def feature_scaling(df, config):
     
     return df, scalers
 
-def data_aggregation(df, config):
-    """数据聚合"""
+def data_aggregation(df, config, key_index=None):
+    """
+    数据聚合
+    :param key_index: 去重阶段得到的 KeyIndex，分组字段与其键列相同时直接复用分组编号
+    """
     if 'aggregation' not in config:
         return df
 
     agg_config = config['aggregation']
+    group_by = agg_config['group_by']
     try:
-        grouped = df.groupby(agg_config['group_by'])
-        df = grouped.agg(agg_config['agg_dict']).reset_index()
+        columns = [group_by] if isinstance(group_by, str) else group_by
+        agg_dict = agg_config['agg_dict']
+        codes = None
+        # agg_dict 对键列本身做聚合时走普通分组，与 df.groupby(group_by) 的输出保持一致
+        if key_index is not None and not (isinstance(agg_dict, dict) and set(agg_dict) & set(columns)):
+            codes = key_index.codes_for(df, columns)
+        if codes is not None:
+            # 分组编号已按键值升序排列，以 Categorical 分组不再对键做哈希；
+            # 键列不参与聚合，与按列名分组时一样被排除在结果之外
+            grouper = pd.Categorical.from_codes(codes, categories=pd.RangeIndex(len(key_index.keys)))
+            result = df.drop(columns=columns).groupby(grouper, observed=True).agg(agg_dict)
+            keys = key_index.keys.iloc[result.index.to_numpy()]
+            if isinstance(group_by, str):
+                result.index = pd.Index(keys[group_by].to_numpy(), name=group_by)
+            else:
+                result.index = pd.MultiIndex.from_frame(keys)
+            df = result.reset_index()
+            logging.info(f"复用去重阶段的键索引，分组字段：{group_by}")
+        else:
+            grouped = df.groupby(group_by)
+            df = grouped.agg(agg_dict).reset_index()
         logging.info(f"数据聚合完成，分组字段：{agg_config['group_by']}")
     except Exception as e:
         logging.error(f"数据聚合失败：{str(e)}")
@@ -14,8 +14,11 @@ def calculate_data_quality_metrics(df):
     metrics['duplicate_rows'] = df.duplicated().sum()
     return metrics
 
-def generate_visualization_report(df, original_df, config):
-    """生成可视化报告"""
+def generate_visualization_report(df, original_df, config, approx_metrics=None):
+    """
+    生成可视化报告
+    :param approx_metrics: 近似模式下带误差界的质量指标，提供时替代基于样本直接计算的指标
+    """
     if not('generate_reports' in config and config['generate_reports']):
         return
     # 创建图表目录
@@ -60,8 +63,12 @@ def generate_visualization_report(df, original_df, config):
         fig.write_html(bar_path)
 
     # 计算数据质量指标
-    pre_cleaning_metrics = calculate_data_quality_metrics(original_df) if original_df is not None else None
-    post_cleaning_metrics = calculate_data_quality_metrics(df)
+    if approx_metrics is not None:
+        pre_cleaning_metrics = approx_metrics['pre']
+        post_cleaning_metrics = approx_metrics['post']
+    else:
+        pre_cleaning_metrics = calculate_data_quality_metrics(original_df) if original_df is not None else None
+        post_cleaning_metrics = calculate_data_quality_metrics(df)
 
     # 生成 HTML 报告
     env = Environment(loader=FileSystemLoader('.'))
@@ -80,19 +87,28 @@ def generate_visualization_report(df, original_df, config):
 
     logging.info(f"可视化报告已生成：{report_path}")
 
-def generate_data_quality_comparison_report(df, original_df, config):
-    """生成数据质量对比报告"""
+def generate_data_quality_comparison_report(df, original_df, config, approx_metrics=None):
+    """
+    生成数据质量对比报告
+    :param approx_metrics: 近似模式下带误差界的质量指标，提供时替代基于样本直接计算的指标
+    """
     if not('generate_reports' in config and config['generate_reports']):
         return
-    # 计算清洗前的数据质量指标
-    pre_cleaning_metrics = calculate_data_quality_metrics(original_df) if original_df is not None else None
+    if approx_metrics is not None:
+        pre_cleaning_metrics = approx_metrics['pre']
+        post_cleaning_metrics = approx_metrics['post']
+    else:
+        # 计算清洗前的数据质量指标
+        pre_cleaning_metrics = calculate_data_quality_metrics(original_df) if original_df is not None else None
 
-    # 计算清洗后的数据质量指标
-    post_cleaning_metrics = calculate_data_quality_metrics(df)
+        # 计算清洗后的数据质量指标
+        post_cleaning_metrics = calculate_data_quality_metrics(df)
 
     # 生成报告内容
     report_content = "数据质量对比报告\n"
     report_content += "=" * 30 + "\n"
+    if approx_metrics is not None:
+        report_content += f"（近似模式：基于抽样估计，误差界置信度 {approx_metrics['confidence']:.0%}）\n\n"
 
     if pre_cleaning_metrics:
         report_content += "清洗前数据质量指标:\n"
@@ -104,6 +120,15 @@ def generate_data_quality_comparison_report(df, original_df, config):
     for key, value in post_cleaning_metrics.items():
         report_content += f"{key}: {value}\n"
 
+    if approx_metrics is not None:
+        report_content += "\n清洗前各列不同值个数（估计）:\n"
+        for col, value in approx_metrics['distinct_counts'].items():
+            report_content += f"{col}: {value}\n"
+        report_content += "\n清洗前数值列分位数（估计值 [下界, 上界]）:\n"
+        for col, bounds in approx_metrics['quantiles'].items():
+            items = [f"p{q * 100:.0f}={value:.4g} [{low:.4g}, {high:.4g}]" for q, (value, low, high) in bounds.items()]
+            report_content += f"{col}: {', '.join(items)}\n"
+
     # 保存报告到文件
     report_path = os.path.join(config['output_path'], f"report")
     report_path = os.path.join(report_path, 'data_quality_comparison_report.txt')
@@ -0,0 +1,279 @@
+import math
+import logging
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from .report_generator import calculate_data_quality_metrics
+from .data_loader import get_file_format, resolve_input_files, parse_partitions, add_partition_columns
+
+# 哈希值取值范围，用于 KMV 基数估计
+_HASH_SPACE = float(2 ** 64)
+
+
+class KMVSketch:
+    """
+    K 最小值（KMV）基数草图
+    只保留哈希值最小的 k 个不同值，据此估计不同值个数，相对标准误差约为 1/sqrt(k-2)
+    """
+
+    def __init__(self, k=4096):
+        self.k = k
+        self.values = np.empty(0, dtype=np.uint64)
+
+    def update(self, hashes):
+        """合并一批 uint64 哈希值"""
+        if len(self.values) == self.k:
+            # 草图已满时只有小于当前第 k 小值的哈希可能进入草图，先过滤掉其余的再排序
+            hashes = hashes[hashes < self.values[-1]]
+            if len(hashes) == 0:
+                return
+        merged = np.union1d(self.values, hashes)
+        self.values = merged[:self.k]
+
+    def is_exact(self):
+        """不同值少于 k 个时草图保存了全部哈希，估计是精确的"""
+        return len(self.values) < self.k
+
+    def estimate(self, z=1.96):
+        """返回 (估计值, 误差界)"""
+        if self.is_exact():
+            return float(len(self.values)), 0.0
+        estimate = (self.k - 1) / (float(self.values[-1]) / _HASH_SPACE)
+        return estimate, z * estimate / math.sqrt(self.k - 2)
+
+
+def _read_file_chunks(path, chunksize):
+    """按块读取单个文件，避免为抽样而把整个文件载入内存"""
+    file_format = get_file_format(path)
+    if file_format == 'csv':
+        yield from pd.read_csv(path, encoding='utf-8', encoding_errors='replace', chunksize=chunksize)
+    elif file_format == 'jsonl':
+        yield from pd.read_json(path, lines=True, chunksize=chunksize)
+    elif file_format == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif file_format == 'json':
+        yield pd.read_json(path)
+    else:
+        raise ValueError(f"不支持的文件格式: {path}")
+
+
+def _read_chunks(input_path, chunksize, failures, partition_columns):
+    """按块依次读取 input_path 匹配的全部文件，单个文件读取失败时记录并跳过"""
+    files, root = resolve_input_files(input_path)
+    if root is None:
+        yield from _read_file_chunks(input_path, chunksize)
+        return
+    for path in files:
+        partitions = parse_partitions(path, root)
+        try:
+            for chunk in _read_file_chunks(path, chunksize):
+                partition_columns.update(add_partition_columns(chunk, partitions))
+                yield chunk
+        except Exception as e:
+            # 已产出的块无法撤回，失败文件可能只有前面部分行参与了抽样
+            logging.warning(f"文件 {path} 读取失败：{str(e)}")
+            if failures is not None:
+                failures.append((path, str(e)))
+
+
+def load_sample(config, failures=None):
+    """
+    流式读取输入数据并抽样，同时在全量数据上维护基数与重复率草图
+    配置示例：
+        "sample": {"method": "reservoir", "size": 10000, "seed": 42}
+        "sample": {"method": "stratified", "size": 10000, "stratify_by": "hotel"}
+    :param failures: 可选列表，用于收集读取失败的文件及原因
+    :return: (样本 DataFrame, 全量数据的近似统计)
+    """
+    sample_config = config['sample']
+    input_path = config['input_path']
+    method = sample_config.get('method', 'reservoir')
+    size = int(sample_config.get('size', 10000))
+    stratify_by = sample_config.get('stratify_by')
+    chunksize = int(sample_config.get('chunksize', 100000))
+    sketch_k = int(sample_config.get('sketch_k', 4096))
+    z = NormalDist().inv_cdf(0.5 + sample_config.get('confidence', 0.95) / 2)
+    rng = np.random.default_rng(sample_config.get('seed'))
+    if method == 'stratified' and not stratify_by:
+        raise ValueError("分层抽样需要指定 stratify_by")
+    if method not in ('reservoir', 'stratified'):
+        raise ValueError(f"不支持的抽样方法: {method}")
+
+    # 为每行分配均匀随机数并保留最小的若干行，等价于对整个数据流的无放回简单随机抽样
+    reservoir = None
+    total_rows = 0
+    missing_values = 0
+    stratum_counts = pd.Series(dtype='int64')
+    row_sketch = KMVSketch(sketch_k)
+    column_sketches = {}
+    partition_columns = set()
+    try:
+        for chunk in _read_chunks(input_path, chunksize, failures, partition_columns):
+            # 以全局行号作为索引，抽样结束后据此恢复原始行顺序
+            chunk.index = pd.RangeIndex(total_rows, total_rows + len(chunk))
+            total_rows += len(chunk)
+            missing_values += int(chunk.isnull().sum().sum())
+            row_sketch.update(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+            for col in chunk.columns:
+                sketch = column_sketches.setdefault(col, KMVSketch(sketch_k))
+                sketch.update(pd.util.hash_pandas_object(chunk[col].dropna(), index=False).to_numpy())
+
+            chunk = chunk.assign(_sample_key=rng.random(len(chunk)))
+            combined = chunk if reservoir is None else pd.concat([reservoir, chunk])
+            if method == 'reservoir':
+                reservoir = combined.nsmallest(size, '_sample_key')
+            else:
+                counts = chunk[stratify_by].value_counts(dropna=False)
+                stratum_counts = stratum_counts.add(counts, fill_value=0).astype('int64')
+                # 每层最多需要 size 行，最终再按层大小分配
+                reservoir = combined.sort_values('_sample_key').groupby(stratify_by, dropna=False, sort=False).head(size)
+    except FileNotFoundError:
+        logging.error("输入文件不存在")
+        raise
+
+    if reservoir is None:
+        raise ValueError(f"输入数据为空: {input_path}")
+    if method == 'stratified':
+        # 按层大小等比例分配样本量（每层至少 1 行），使样本近似自加权
+        allocation = (stratum_counts * size / total_rows).round().clip(lower=1).astype('int64')
+        reservoir = reservoir.sort_values('_sample_key')
+        rank = reservoir.groupby(stratify_by, dropna=False, sort=False).cumcount()
+        limit = reservoir[stratify_by].map(allocation)
+        if reservoir[stratify_by].isnull().any() and allocation.index.isnull().any():
+            limit = limit.fillna(allocation[allocation.index.isnull()].iloc[0])
+        reservoir = reservoir[rank < limit]
+    # 恢复原始行顺序，使 ffill 等依赖顺序的处理保持语义
+    sample = reservoir.sort_index().drop(columns='_sample_key').reset_index(drop=True)
+    for col in partition_columns:
+        sample[col] = sample[col].astype('category')
+
+    distinct_rows, distinct_rows_bound = row_sketch.estimate(z)
+    distinct_rows = min(distinct_rows, total_rows)
+    sketch_metrics = {
+        'confidence': sample_config.get('confidence', 0.95),
+        'method': method,
+        'total_rows': total_rows,
+        'sample_rows': len(sample),
+        'missing_values': missing_values,
+        'duplicate_rows': (total_rows - distinct_rows, distinct_rows_bound),
+        'distinct_counts': {col: sketch.estimate(z) for col, sketch in column_sketches.items()},
+    }
+    logging.info(f"抽样完成，方法：{method}，全量 {total_rows} 行，样本 {len(sample)} 行")
+    return sample, sketch_metrics
+
+
+def quantile_bounds(series, quantiles=(0.25, 0.5, 0.75), confidence=0.95):
+    """
+    根据样本估计分位数及其区间
+    由 DKW 不等式，样本经验分布与总体分布的偏差不超过 eps，
+    因此 q 分位数的真实值以给定置信度落在样本 q-eps 与 q+eps 分位数之间。
+    :return: {q: (估计值, 下界, 上界)}
+    """
+    values = series.dropna()
+    if len(values) == 0:
+        return {}
+    eps = math.sqrt(math.log(2 / (1 - confidence)) / (2 * len(values)))
+    result = {}
+    for q in quantiles:
+        result[q] = (values.quantile(q), values.quantile(max(q - eps, 0)), values.quantile(min(q + eps, 1)))
+    return result
+
+
+def _format(estimate, bound):
+    if bound == 0:
+        return f"{estimate:.0f}"
+    return f"{estimate:.0f} ± {bound:.0f}"
+
+
+def approximate_quality_metrics(df, original_df, sketch_metrics, aggregated=False, duplicates=None):
+    """
+    计算近似模式下清洗前后的数据质量指标及误差界
+    清洗前的行数和缺失值由全量流式统计得到（精确），重复行数来自 KMV 草图；
+    清洗后的指标由样本按抽样比例外推，误差界为正态近似下的置信区间半宽。
+    去重与样本大小不成线性关系（重复的行很少同时被抽中），整行去重时清洗后的行数以草图估计的
+    不同行数为基数，只把后续阶段的保留比例从样本外推，并合并两者的误差界。
+    :param aggregated: 结果是否经过聚合，聚合结果不是逐行数据，不做外推
+    :param duplicates: 配置中的 duplicates 节；按键去重或删除全部重复行时无法由草图估计，不做外推
+    :return: {'pre': {...}, 'post': {...}, 'quantiles': {...}, 'distinct_counts': {...}}
+    """
+    confidence = sketch_metrics['confidence']
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    total_rows = sketch_metrics['total_rows']
+    n = len(original_df)
+    scale = total_rows / n
+
+    pre = {
+        'rows': _format(total_rows, 0),
+        'columns': original_df.shape[1],
+        'missing_values': _format(sketch_metrics['missing_values'], 0),
+        'duplicate_rows': _format(*sketch_metrics['duplicate_rows']),
+    }
+
+    if aggregated:
+        post = _sample_metrics(df, "样本聚合结果")
+    elif not (duplicates and duplicates.get('remove')):
+        post = _extrapolate_metrics(df, n, total_rows, scale, z)
+    elif duplicates.get('subset') is None and duplicates.get('keep', 'first') in ('first', 'last'):
+        distinct_rows = total_rows - sketch_metrics['duplicate_rows'][0]
+        post = _extrapolate_deduplicated_metrics(df, original_df, distinct_rows,
+                                                 sketch_metrics['duplicate_rows'][1], z)
+    else:
+        post = _sample_metrics(df, "样本结果，未外推")
+
+    quantiles = {}
+    for col in original_df.select_dtypes(include=[np.number]).columns:
+        quantiles[col] = quantile_bounds(original_df[col], confidence=confidence)
+    return {
+        'confidence': confidence,
+        'pre': pre,
+        'post': post,
+        'quantiles': quantiles,
+        'distinct_counts': {col: _format(*value) for col, value in sketch_metrics['distinct_counts'].items()},
+    }
+
+
+def _extrapolate_metrics(df, n, total_rows, scale, z):
+    """把逐行的清洗后样本指标外推到全量数据"""
+    # 清洗后保留的行比例，按二项分布估计误差
+    kept = len(df) / n
+    rows_bound = z * math.sqrt(kept * (1 - kept) / n) * total_rows
+    # 每行缺失值个数的均值外推到全量
+    row_missing = df.isnull().sum(axis=1)
+    missing_estimate = row_missing.sum() * scale
+    missing_bound = z * row_missing.std(ddof=1) * math.sqrt(n) * scale if len(row_missing) > 1 else 0.0
+    return {
+        'rows': _format(len(df) * scale, rows_bound),
+        'columns': df.shape[1],
+        'missing_values': _format(missing_estimate, 0 if np.isnan(missing_bound) else missing_bound),
+        'duplicate_rows': f"{int(df.duplicated().sum())}（样本内）",
+    }
+
+
+def _sample_metrics(df, label):
+    """无法外推时直接报告样本上的指标，并注明来源"""
+    return {key: f"{value}（{label}）" for key, value in calculate_data_quality_metrics(df).items()}
+
+
+def _extrapolate_deduplicated_metrics(df, original_df, distinct_rows, distinct_bound, z):
+    """
+    整行去重时的外推：去重后的行数取草图估计的全量不同行数，
+    后续阶段的保留比例由样本估计（假设其对重复行与非重复行的作用相同）
+    """
+    deduplicated = len(original_df.drop_duplicates())
+    kept = len(df) / deduplicated if deduplicated else 0.0
+    kept_bound = z * math.sqrt(kept * (1 - kept) / deduplicated) if deduplicated else 0.0
+    rows = distinct_rows * kept
+    rows_bound = math.hypot(kept * distinct_bound, distinct_rows * kept_bound)
+    # 每行缺失值个数的均值乘以估计行数，误差界合并均值与行数两部分的不确定性
+    row_missing = df.isnull().sum(axis=1)
+    mean_missing = row_missing.mean() if len(row_missing) else 0.0
+    mean_bound = z * row_missing.std(ddof=1) / math.sqrt(len(row_missing)) if len(row_missing) > 1 else 0.0
+    missing_bound = math.hypot(mean_missing * rows_bound, rows * mean_bound)
+    return {
+        'rows': _format(rows, rows_bound),
+        'columns': df.shape[1],
+        'missing_values': _format(rows * mean_missing, missing_bound),
+        'duplicate_rows': f"{int(df.duplicated().sum())}（样本内）",
+    }
@@ -0,0 +1,402 @@
+"""
+常驻数据清洗服务
+在本地 HTTP 端口上封装 DataProcessingPipeline，接收作业提交、按优先级排队，
+并在预热好的进程池中执行，避免每次调用都重新启动解释器、导入依赖和生成报告模板。
+
+接口：
+    POST /jobs          提交作业，请求体为 JSON：
+                        {"config_path": "...", 或 "config": {...},
+                         "priority": 0, "memory_limit_mb": 2048}
+                        priority 数值越小越优先
+    GET  /jobs          列出全部作业状态
+    GET  /jobs/<job_id> 查询单个作业状态及各阶段耗时
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import logging
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，无法限制内存
+    resource = None
+
+from .template_generator import create_report_template
+
+# 工作进程预热时导入的重量级依赖，forkserver 预先导入后，新工作进程可直接继承
+_PRELOAD_MODULES = ['pandas', 'sklearn.preprocessing', 'plotly.express', 'dataclean.__main__']
+
+# 作业状态
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+# 工作进程预热完成后的虚拟内存大小，作业的内存预算以此为基准
+_baseline_address_space = None
+
+
+def _warm_up_worker():
+    """进程池初始化：提前导入重量级依赖，使作业无需再承担导入开销，并记录内存基准"""
+    global _baseline_address_space
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由主进程统一处理中断并关闭进程池
+    import pandas  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+    import plotly.express  # noqa: F401
+    from . import __main__  # noqa: F401  加载 DataProcessingPipeline 及全部处理模块
+    _baseline_address_space = _current_address_space()
+
+
+def _current_address_space():
+    """返回当前进程已占用的虚拟内存大小（字节），无法获取时返回 0"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _is_out_of_memory(error):
+    """MemoryError 以及 pandas C 解析器分配内存失败时抛出的 ParserError 都表示超出内存上限"""
+    return isinstance(error, MemoryError) or 'out of memory' in str(error).lower()
+
+
+def _run_job(config, memory_limit_mb):
+    """
+    在工作进程中执行单个作业
+    :param config: 作业配置字典
+    :param memory_limit_mb: 作业可额外占用的内存上限（MB），为空时不限制
+    :return: 输出文件路径、结果形状及各阶段耗时；作业失败时包含错误信息、失败阶段及此前各阶段耗时
+    """
+    from .__main__ import DataProcessingPipeline
+
+    previous_limit = None
+    if memory_limit_mb and resource is not None:
+        # 在预热完成时的占用基础上为本作业设置地址空间上限，超出时抛出 MemoryError
+        previous_limit = resource.getrlimit(resource.RLIMIT_AS)
+        baseline = _baseline_address_space or _current_address_space()
+        budget = baseline + int(memory_limit_mb) * 1024 * 1024
+        hard = previous_limit[1]
+        if hard != resource.RLIM_INFINITY:
+            budget = min(budget, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (budget, hard))
+
+    pipeline = DataProcessingPipeline(config)
+    try:
+        output_file_path = pipeline.run()
+        return {
+            'output_file': output_file_path,
+            'shape': list(pipeline.df.shape),
+            'stage_timings': pipeline.stage_timings,
+            'load_failures': pipeline.load_failures,
+        }
+    except Exception as e:
+        # 在工作进程内捕获异常，使失败作业也能带回各阶段耗时
+        error = f"作业超出内存预算 {memory_limit_mb} MB" if memory_limit_mb and _is_out_of_memory(e) else str(e)
+        return {
+            'error': error,
+            'failed_stage': next(reversed(pipeline.stage_timings), None),
+            'stage_timings': pipeline.stage_timings,
+            'load_failures': pipeline.load_failures,
+        }
+    finally:
+        pipeline.df = None  # 尽快释放大对象，避免影响同一进程中的后续作业
+        if previous_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_limit)
+
+
+class Job:
+    """服务中的单个清洗作业"""
+
+    def __init__(self, config, priority=0, memory_limit_mb=None):
+        self.job_id = uuid.uuid4().hex
+        self.config = config
+        self.priority = priority
+        self.memory_limit_mb = memory_limit_mb
+        self.status = PENDING
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.crashes = 0  # 所在进程池异常中断的次数
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'priority': self.priority,
+            'memory_limit_mb': self.memory_limit_mb,
+            'input_path': self.config.get('input_path'),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queue_seconds': (self.started_at or time.time()) - self.submitted_at,
+            'run_seconds': ((self.finished_at or time.time()) - self.started_at) if self.started_at else None,
+            'stage_timings': self.result['stage_timings'] if self.result else None,
+            'failed_stage': self.result.get('failed_stage') if self.result else None,
+            'output_file': self.result.get('output_file') if self.result else None,
+            'shape': self.result.get('shape') if self.result else None,
+            'load_failures': self.result['load_failures'] if self.result else None,
+            'error': self.error,
+        }
+
+
+class PipelineService:
+    """作业队列与预热进程池"""
+
+    def __init__(self, workers=2, max_concurrent=None, default_memory_limit_mb=None):
+        """
+        :param workers: 工作进程数量
+        :param max_concurrent: 同时运行的作业上限，默认与工作进程数量相同，不能超过工作进程数量
+        :param default_memory_limit_mb: 未指定时每个作业的内存预算（MB）
+        """
+        self.workers = workers
+        if max_concurrent and max_concurrent > workers:
+            # 超出工作进程数量的作业只会在进程池内部按先进先出排队，既打乱优先级也会误报排队时间
+            logging.warning(f"并发上限 {max_concurrent} 超过工作进程数量，已调整为 {workers}")
+            max_concurrent = workers
+        self.max_concurrent = max_concurrent or workers
+        self.default_memory_limit_mb = default_memory_limit_mb
+        self.jobs = {}
+        self._queue = []  # (priority, 提交序号, job)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._running = 0
+        self._isolated_job = None  # 正在单独运行、用于确认是否导致进程池中断的作业
+        self._stopped = False
+        self._rebuilding = False  # 是否正在重建进程池
+        self._executor = None
+        self._dispatcher = None
+
+    def start(self):
+        """创建报告模板、启动并预热进程池以及调度线程"""
+        create_report_template()
+        self._executor = self._create_executor()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+        self._dispatcher.start()
+        logging.info(f"清洗服务已启动，工作进程：{self.workers}，并发上限：{self.max_concurrent}")
+
+    def _create_executor(self):
+        # 服务进程中有 HTTP 和调度线程，直接 fork 可能继承被其他线程持有的锁而死锁
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(_PRELOAD_MODULES)
+        else:
+            context = multiprocessing.get_context('spawn')
+        # 每个工作进程只执行一个作业：作业结束后进程退出并由预热好的新进程替换，
+        # 避免前一个作业遗留的线程栈和 malloc 内存区占用后续作业的内存预算
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up_worker,
+                                       mp_context=context, max_tasks_per_child=1)
+        # 提前拉起全部工作进程（forkserver 同时完成依赖预加载），使首个作业无需等待导入
+        for future in [executor.submit(time.sleep, 0) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def stop(self):
+        """停止调度并关闭进程池"""
+        with self._lock:
+            self._stopped = True
+            self._changed.notify_all()
+            while self._rebuilding:
+                self._changed.wait()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if os.path.exists("report_template.html"):
+            os.remove("report_template.html")
+        logging.info("清洗服务已停止")
+
+    def submit(self, config, priority=0, memory_limit_mb=None):
+        """提交作业，返回作业对象"""
+        if 'input_path' not in config or 'output_path' not in config:
+            raise ValueError("配置中必须包含 input_path 和 output_path")
+        job = Job(config, priority, memory_limit_mb or self.default_memory_limit_mb)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._enqueue(job)
+        logging.info(f"作业 {job.job_id} 已提交，优先级：{priority}")
+        return job
+
+    def _enqueue(self, job):
+        """把作业放入优先级队列，调用方需持有锁"""
+        heapq.heappush(self._queue, (job.priority, self._counter, job))
+        self._counter += 1
+        self._changed.notify_all()
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def _can_start(self, job):
+        """判断队首作业能否启动，调用方需持有锁"""
+        if self._isolated_job is not None:
+            return False
+        if job.crashes:
+            # 曾随进程池中断的作业单独运行，以确认是否由它导致
+            return self._running == 0
+        return self._running < self.max_concurrent
+
+    def _dispatch_loop(self):
+        """按优先级从队列取出作业，在并发上限内提交到进程池"""
+        while True:
+            with self._lock:
+                while not self._stopped and not (self._queue and self._can_start(self._queue[0][2])):
+                    self._changed.wait()
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                self._running += 1
+                if job.crashes:
+                    self._isolated_job = job
+                job.status = RUNNING
+                job.started_at = time.time()
+            executor = self._executor
+            try:
+                future = executor.submit(_run_job, job.config, job.memory_limit_mb)
+            except BrokenProcessPool:
+                executor = self._replace_executor(executor)
+                future = executor.submit(_run_job, job.config, job.memory_limit_mb)
+            future.add_done_callback(lambda f, job=job, executor=executor: self._on_job_done(job, executor, f))
+
+    def _replace_executor(self, broken):
+        """重建已损坏的进程池，多个作业同时失败时只重建一次"""
+        with self._lock:
+            while self._rebuilding:
+                self._changed.wait()
+            if self._executor is not broken or self._stopped:
+                return self._executor
+            self._rebuilding = True
+        # 预热新进程池需要数秒，在锁外进行，避免阻塞作业提交和状态查询
+        try:
+            executor = self._create_executor()
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+                self._changed.notify_all()
+            raise
+        with self._lock:
+            self._executor = executor
+            self._rebuilding = False
+            self._changed.notify_all()
+        broken.shutdown(wait=False)
+        return executor
+
+    def _on_job_done(self, job, executor, future):
+        requeue = False
+        try:
+            job.result = future.result()
+            if 'error' in job.result:
+                job.status = FAILED
+                job.error = job.result['error']
+                logging.error(f"作业 {job.job_id} 在阶段 {job.result['failed_stage']} 失败：{job.error}")
+            else:
+                job.status = SUCCEEDED
+                logging.info(f"作业 {job.job_id} 已完成，耗时：{time.time() - job.started_at:.2f} 秒")
+        except BrokenProcessPool:
+            # 任一工作进程被系统强制终止（通常是内存耗尽）都会使整个进程池中断，
+            # 无法确定是哪个作业导致的：先重新排队并单独运行，单独运行仍中断才判定失败
+            self._replace_executor(executor)
+            if job.crashes:
+                job.status = FAILED
+                job.error = "作业单独运行时工作进程异常退出，可能超出内存预算"
+                logging.error(f"作业 {job.job_id} 失败：{job.error}")
+            else:
+                job.crashes += 1
+                requeue = True
+                logging.warning(f"进程池异常中断，作业 {job.job_id} 重新排队并单独运行")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logging.error(f"作业 {job.job_id} 失败：{job.error}")
+        with self._lock:
+            self._running -= 1
+            if self._isolated_job is job:
+                self._isolated_job = None
+            if requeue:
+                job.status = PENDING
+                job.started_at = None
+                self._enqueue(job)
+            else:
+                job.finished_at = time.time()
+            self._changed.notify_all()
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """清洗服务的 HTTP 接口"""
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            self._send_json(200, self.service.list_jobs())
+        elif path.startswith('/jobs/'):
+            job = self.service.get_job(path[len('/jobs/'):])
+            if job is None:
+                self._send_json(404, {'error': '作业不存在'})
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {'error': '未知路径'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error': '未知路径'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if 'config' in request:
+                config = request['config']
+            elif 'config_path' in request:
+                with open(request['config_path'], 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            else:
+                raise ValueError("请求中必须包含 config 或 config_path")
+            job = self.service.submit(config,
+                                      priority=int(request.get('priority', 0)),
+                                      memory_limit_mb=request.get('memory_limit_mb'))
+        except Exception as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+def serve(host='127.0.0.1', port=8765, workers=2, max_concurrent=None, memory_limit_mb=None):
+    """启动常驻清洗服务，阻塞直到被中断"""
+    service = PipelineService(workers, max_concurrent, memory_limit_mb)
+    service.start()
+    handler = type('ServiceRequestHandler', (_ServiceRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logging.info(f"清洗服务监听于 http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
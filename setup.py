@@ -22,6 +22,7 @@ setuptools.setup(
     install_requires=[
         'pandas',
         'numpy',
+        'pyarrow',
         'scikit-learn',
         'plotly',
         'jinja2',